@@ -1,32 +1,103 @@
 # --- Mathematical methods used in elliptic curve cryptography --- #
 
+# --- Integer backend --- #
+### --- We use the GMP integers from gmpy2 when available, otherwise Python's built in integers --- ###
+try:
+    from gmpy2 import mpz, invert, powmod, powmod_sec
+    from gmpy2 import jacobi as gmp_jacobi
+except ImportError:
+    mpz = int
+    powmod = pow
+    powmod_sec = pow  # Python's pow makes no constant time guarantees
+    gmp_jacobi = None
+
+    def invert(n: int, p: int) -> int:
+        '''
+        Returns the inverse of n modulo p
+        '''
+        return pow(n, -1, p)
+
+
 def legendre_symbol(n: int, p: int) -> int:
     '''
     We calculate n^(p-1)/2 (mod p). The result will either be 0, 1 or p-1.
     If it's p-1 we return -1 otherwise we return the value
     '''
-    flt = pow(n, (p - 1) // 2, p)
+    flt = powmod(n, (p - 1) // 2, p)
     if flt == p - 1:
         return -1
     return flt
 
 
+def jacobi_symbol(n: int, m: int) -> int:
+    '''
+    We calculate the Jacobi symbol (n|m) for odd m > 0 using quadratic reciprocity. The algorithm only uses
+    shifts and remainders, which is considerably cheaper than the modular exponentiation in legendre_symbol.
+    For m prime the Jacobi symbol agrees with the Legendre symbol.
+    '''
+    # Use GMP when available
+    if gmp_jacobi is not None:
+        return gmp_jacobi(n, m)
+
+    n %= m
+    result = 1
+    while n:
+        # Remove factors of 2 - (2|m) = -1 iff m = 3, 5 (mod 8)
+        s = (n & -n).bit_length() - 1
+        n >>= s
+        if s & 1 and m & 7 in (3, 5):
+            result = -result
+
+        # Reciprocity - flip sign iff n = m = 3 (mod 4)
+        if n & m & 2:
+            result = -result
+        n, m = m % n, n
+
+    # Return 0 if n and m share a factor
+    if m != 1:
+        return 0
+    return result
+
+
 def is_quadratic_residue(n: int, p: int) -> bool:
     '''
-    Returns True if (n|p) != -1
+    Returns True if (n|p) != -1. As p is prime, we use the Jacobi symbol.
     '''
-    if legendre_symbol(n, p) == -1:
+    if jacobi_symbol(n, p) == -1:
         return False
     return True
 
 
-def tonelli_shanks(n: int, p: int):
+def tonelli_shanks_parameters(p: int) -> tuple:
+    '''
+    Returns the values (s, Q, c) used in tonelli_shanks, which only depend on p. Here p-1 = 2^s * Q with Q odd
+    and c = z^Q (mod p) for the least quadratic non residue z. These can be computed once for a fixed p.
+    '''
+    p = mpz(p)
+
+    # Divide p-1 into its even and odd components by p-1 = 2^s * Q, where Q is odd and s >=1
+    Q = p - 1
+    s = 0
+    while Q % 2 == 0:
+        s += 1
+        Q //= 2
+
+    # Find a quadratic non residue
+    z = 2
+    while jacobi_symbol(z, p) != -1:
+        z += 1
+
+    return s, Q, powmod(z, Q, p)
+
+
+def tonelli_shanks(n: int, p: int, parameters=None):
     '''
     If n is a quadratic residue mod p, then we return an integer r such that r^2 = n (mod p).
+    The parameters from tonelli_shanks_parameters can be given if they have already been computed for p.
     '''
 
     # Verify n is a quadratic residue
-    if legendre_symbol(n, p) == -1:
+    if jacobi_symbol(n, p) == -1:
         return None
 
     # Trivial case
@@ -35,26 +106,29 @@ def tonelli_shanks(n: int, p: int):
 
     # p = 3 (mod 4) case
     if p % 4 == 3:
-        return pow(n, (p + 1) // 4, p)
+        return int(powmod(n, (p + 1) // 4, p))
+
+    # p = 5 (mod 8) case - r = n^((p+3)/8) satisfies r^2 = n or r^2 = -n, and 2^((p-1)/4) is a square root of -1
+    if p % 8 == 5:
+        r = powmod(n, (p + 3) // 8, p)
+        if (r * r - n) % p != 0:
+            r = (r * powmod(2, (p - 1) // 4, p)) % p
+        return int(r)
 
     ###--- General Case ---###
-    # 1) Divide p-1 into its even and odd components by p-1 = 2^s * Q, where Q is odd and s >=1
-    Q = p - 1
-    s = 0
-    while Q % 2 == 0:
-        s += 1
-        Q //= 2
+    # 0) Work with GMP integers when available - the squaring chains below are the hot loop
+    n = mpz(n) % p
+    p = mpz(p)
 
-    # 2) Find a quadratic non residue
-    z = 2
-    while legendre_symbol(z, p) != -1:
-        z += 1
+    # 1) - 2) Get p-1 = 2^s * Q and c = z^Q for a quadratic non residue z
+    if parameters is None:
+        parameters = tonelli_shanks_parameters(p)
+    s, Q, c = parameters
 
     # 3) Configure initial variables
     M = s
-    c = pow(z, Q, p)
-    t = pow(n, Q, p)
-    R = pow(n, (Q + 1) // 2, p)
+    t = powmod(n, Q, p)
+    R = powmod(n, (Q + 1) // 2, p)
 
     # 4) Repeat until t == 1
     while t != 1:
@@ -66,12 +140,61 @@ def tonelli_shanks(n: int, p: int):
             i += 1
             factor = (factor * factor) % p
 
-        # Reassign variables
-        exp = 2 ** (M - i - 1)
-        b = pow(c, exp, p)
+        # Reassign variables - b = c^(2^(M-i-1)) by repeated squaring
+        b = c
+        for _ in range(M - i - 1):
+            b = (b * b) % p
         M = i
         c = (b * b) % p
         t = (t * c) % p
         R = (R * b) % p
 
-    return R
+    return int(R)
+
+
+def wnaf(n: int, w: int) -> list:
+    '''
+    Returns the width-w non-adjacent form of n as a list of signed digits, least significant digit first.
+    Every non-zero digit is odd with absolute value less than 2^(w-1), and any w consecutive digits contain at
+    most one non-zero digit.
+    '''
+    modulus = 1 << w
+    half = 1 << (w - 1)
+    digits = []
+    while n > 0:
+        if n & 1:
+            z = n & (modulus - 1)
+            if z >= half:
+                z -= modulus
+            n -= z
+            digits.append(z)
+        else:
+            digits.append(0)
+        n >>= 1
+    return digits
+
+
+def batch_invert(values: list, p: int) -> list:
+    '''
+    Returns the inverses modulo p of the given non-zero values using Montgomery's trick. We invert the product
+    of all values once and recover each inverse from the prefix products, which costs a single inversion and
+    3(N-1) multiplications for N values.
+    '''
+    if not values:
+        return []
+
+    # Prefix products v_0 * v_1 * ... * v_i
+    prefix = []
+    acc = 1
+    for v in values:
+        acc = (acc * v) % p
+        prefix.append(acc)
+
+    # Walk backwards - inv is the inverse of v_0 * ... * v_i at step i
+    inv = invert(acc, p)
+    inverses = [0] * len(values)
+    for i in range(len(values) - 1, 0, -1):
+        inverses[i] = (inv * prefix[i - 1]) % p
+        inv = (inv * values[i]) % p
+    inverses[0] = inv
+    return inverses
@@ -1,10 +1,16 @@
 # --- IMPORTS --- #
 import json
+import math
 import secrets
 
 from primefac import isprime
 
-from .cryptomath import is_quadratic_residue, tonelli_shanks
+from .cryptomath import batch_invert, invert, is_quadratic_residue, mpz, powmod, powmod_sec, tonelli_shanks, \
+    tonelli_shanks_parameters, wnaf
+
+# --- CONSTANTS --- #
+ECC_DEBUG = False  # Verify the results of the group operations against the curve equation
+JACOBIAN_INFINITY = (1, 1, 0)  # Point at infinity in Jacobian coordinates - any triple with Z = 0
 
 
 # --- CLASSES --- #
@@ -56,6 +62,13 @@ class CurveFactory:
 
 
 class EllipticCurve:
+    # --- CONSTANT --- #
+    WNAF_WIDTH = 5  # Window width used in scalar multiplication
+    WNAF_MIN_BITS = 48  # Scalars with fewer bits use plain NAF, as the wNAF precomputation would not pay off
+    FIXED_WINDOW = 8  # Window width in bits of the generator table
+    BSGS_MIN_PRIME = 200  # Smallest prime for which get_order uses baby-step giant-step
+    BSGS_ATTEMPTS = 10  # Number of random points tried in get_order before counting points
+    RANDOM_POINT_BATCH = 16  # Number of candidate x values drawn at once in random_point
 
     def __init__(self, a: int, b: int, p: int, order=None, generator=None):
         '''
@@ -67,27 +80,55 @@ class EllipticCurve:
         point at infinity. The order variable refers to the order of this group. As the group is cyclic,
         it will contain a generator point, which can be specified during instantiation.
 
+        If gmpy2 is installed, the curve values are stored as GMP integers. Points returned by the curve are
+        always tuples of Python integers.
         '''
         # Get curve values
-        self.a = a
-        self.b = b
-        self.p = p
+        self.a = mpz(a)
+        self.b = mpz(b)
+        self.p = mpz(p)
+
+        # Square roots are a single exponentiation for p = 3 (mod 4) and p = 5 (mod 8), otherwise cache the
+        # tonelli shanks values
+        self._sqrt_exp = None
+        self._sqrt_i = None
+        self._ts_parameters = None
+        if p % 4 == 3:
+            self._sqrt_exp = (self.p + 1) // 4
+        elif p % 8 == 5:
+            self._sqrt_exp = (self.p + 3) // 8
+            self._sqrt_i = powmod(2, (self.p - 1) // 4, self.p)
+        else:
+            self._ts_parameters = tonelli_shanks_parameters(self.p)
+
+        # Select the doubling formulas and right hand side - curves with a = 0 skip the terms in a
+        if a % p == 0:
+            self._dbl = self._jac_double_a0
+            self.x_terms = self._x_terms_a0
+        else:
+            self._dbl = self._jac_double
 
         # Get order for small prime
         if self.p <= CurveFactory.MAX_PRIME and order is None:
-            self.order = self.get_order()
+            self.order = mpz(self.get_order())
         else:
-            self.order = order
+            self.order = None if order is None else mpz(order)
 
         # Check if generator is on the curve
         if generator is not None and not self.is_point_on_curve(generator):
             generator = None
 
-        # Get generator
+        # Get generator - a curve of order 1 only has the point at infinity, so random_point would never return
         self.generator = generator
-        if generator is None:
+        if generator is None and self.order != 1:
             self.generator = self.random_point()
 
+        # Generator table is built on first use
+        self._gen_table = None
+
+        # Primality of the order is cached on first use, see _order_is_prime
+        self._order_primality = None
+
     def __repr__(self):
         hex_dict = {
             'a':hex(self.a),
@@ -101,23 +142,39 @@ class EllipticCurve:
     # --- Right Hand Side --- #
 
     def x_terms(self, x):
-        return pow(x, 3) + self.a * x + self.b
+        '''
+        Returns x^3 + ax + b (mod p). Curves with a = 0 use _x_terms_a0 instead, see __init__.
+        '''
+        return (x * x * x + self.a * x + self.b) % self.p
+
+    def _x_terms_a0(self, x):
+        '''
+        Returns x^3 + b (mod p), the right hand side for curves with a = 0.
+        '''
+        return (x * x * x + self.b) % self.p
 
     # --- Points on curve --- #
 
     def random_point(self) -> tuple:
         '''
-        Returns random point on the curve
-        '''
-        x = secrets.randbelow(self.p - 1)
-        while not self.is_x_on_curve(x):
-            x += 1
-            if x >= self.p - 1:  # If x gets too big we choose another x
-                x = secrets.randbelow(self.p - 1)
+        Returns random point on the curve. We draw a batch of candidate x values from a single call to secrets and
+        return the first candidate on the curve. Each candidate is uniform in [0, p) by rejection sampling.
 
-        y = self.find_y_from_x(x)
-        point = (x, y)
-        return point
+        About half the candidates are not on the curve. We reject these with the Jacobi symbol, which is much
+        cheaper than a square root attempt, and only call find_y_from_x for the candidate we return.
+        '''
+        p = int(self.p)
+        bits = p.bit_length()
+        mask = (1 << bits) - 1
+        batch = self.RANDOM_POINT_BATCH
+        is_x_on_curve = self.is_x_on_curve
+        while True:
+            candidates = secrets.randbits(bits * batch)
+            for _ in range(batch):
+                x = candidates & mask
+                candidates >>= bits
+                if x < p and is_x_on_curve(x):
+                    return (x, self.find_y_from_x(x))
 
     def is_point_on_curve(self, point: tuple) -> bool:
         '''
@@ -129,7 +186,7 @@ class EllipticCurve:
 
         # Return True if y^2 = x^3 + ax +b (mod p) and False otherwise
         x, y = point
-        return (self.x_terms(x) - pow(y, 2)) % self.p == 0
+        return (self.x_terms(x) - y * y) % self.p == 0
 
     def is_x_on_curve(self, x: int) -> bool:
         '''
@@ -143,106 +200,341 @@ class EllipticCurve:
         '''
         Using tonelli shanks, we return y such that E(x,y) = 0, if x is on the curve.
         Note that if (x,y) is a point then (x,p-y) will be a point as well.
+
+        For p = 3 (mod 4), the candidate y = r^((p+1)/4) satisfies y^2 = r iff r = x^3 + ax + b is a quadratic
+        residue. Hence we only need one exponentiation and one squaring to both find y and verify x.
+
+        For p = 5 (mod 8), the candidate y = r^((p+3)/8) satisfies y^2 = r or y^2 = -r when r is a quadratic
+        residue. In the latter case we multiply y by i = 2^((p-1)/4), a square root of -1 mod p.
         '''
 
-        # Verify x is on curve
-        try:
-            assert self.is_x_on_curve(x)
-        except AssertionError:
-            return None
+        p = self.p
+        rhs = self.x_terms(x)
 
-        # Find the two possible y values
-        y = tonelli_shanks(self.x_terms(x), self.p)
-        neg_y = -y % self.p
+        # p = 3 (mod 4) and p = 5 (mod 8) cases
+        if self._sqrt_exp is not None:
+            y = powmod(rhs, self._sqrt_exp, p)
+            if self._sqrt_i is not None and (y * y) % p != rhs:
+                y = (y * self._sqrt_i) % p
+            if (y * y) % p != rhs:
+                return None
+            return int(y)
 
-        # Check y values
+        # Find y - tonelli_shanks returns None if x is not on the curve
+        y = tonelli_shanks(rhs, p, self._ts_parameters)
+        if y is None:
+            return None
+
+        # Check y value
         try:
             assert self.is_point_on_curve((x, y))
-            assert self.add_points((x, y), (x, neg_y)) is None
         except AssertionError:
             return None
 
         # Return y
-        return y
+        return int(y)
 
     # --- Group operations --- #
 
     def add_points(self, point1: tuple, point2: tuple):
         '''
-        Adding points using the elliptic curve addition rules.
+        Adding points using the elliptic curve addition rules. The point at infinity is given by None, and we raise
+        a ValueError if either point is not on the curve.
         '''
 
         # Verify points exist
-        try:
-            assert self.is_point_on_curve(point1)
-            assert self.is_point_on_curve(point2)
-        except AssertionError:
-            return None
+        if not self.is_point_on_curve(point1) or not self.is_point_on_curve(point2):
+            raise ValueError('Point is not on the curve')
+
+        # Add points
+        point = self._add_points_unchecked(point1, point2)
+
+        # Verify results in debug mode
+        if ECC_DEBUG:
+            assert self.is_point_on_curve(point)
+
+        # Return sum of points
+        return point
 
+    def _add_points_unchecked(self, point1: tuple, point2: tuple):
+        '''
+        Adds two points which are known to be on the curve, without validation. Used by the library internally.
+        '''
         # Point at infinity cases
         if point1 is None:
             return point2
         if point2 is None:
             return point1
 
-        # Get coordinates
+        # Dispatch on x values
         x1, y1 = point1
         x2, y2 = point2
+        if x1 != x2:  # Points are distinct
+            return self._add_distinct(point1, point2)
+        if y1 != y2:  # Points are inverses
+            return None
+        return self._double_point(point1)
 
-        # Get slope if it exists
-        if x1 == x2:
-            if y1 != y2:  # Points are inverses
-                return None
-            elif y1 == 0:  # Point is its own inverse when lying on the x axis
-                return None
-            else:  # Points are the same
-                m = ((3 * x1 * x1 + self.a) * pow(2 * y1, -1, self.p)) % self.p
-        else:  # Points are distinct
-            m = ((y2 - y1) * pow(x2 - x1, -1, self.p)) % self.p
+    def _double_point(self, point: tuple):
+        '''
+        Doubles a point known to be on the curve, using the tangent slope m = (3x^2 + a) / 2y.
+        '''
+        x, y = point
+        p = self.p
+
+        # Point is its own inverse when lying on the x axis
+        if y % p == 0:
+            return None
 
-        # Use the addition formulas
-        x3 = (m * m - x1 - x2) % self.p
-        y3 = (m * (x1 - x3) - y1) % self.p
-        point = (x3, y3)
+        m = ((3 * x * x + self.a) * invert(2 * y, p)) % p
+        x3 = (m * m - 2 * x) % p
+        y3 = (m * (x - x3) - y) % p
+        return (int(x3), int(y3))
 
-        # Verify result
-        try:
-            assert self.is_point_on_curve(point)
-        except AssertionError:
+    def _add_distinct(self, point1: tuple, point2: tuple):
+        '''
+        Adds two affine points with distinct x values, using the secant slope m = (y2 - y1) / (x2 - x1).
+        '''
+        x1, y1 = point1
+        x2, y2 = point2
+        p = self.p
+
+        m = ((y2 - y1) * invert(x2 - x1, p)) % p
+        x3 = (m * m - x1 - x2) % p
+        y3 = (m * (x1 - x3) - y1) % p
+        return (int(x3), int(y3))
+
+    def _batch_add_points(self, points1: list, points2: list) -> list:
+        '''
+        Returns the sums points1[i] + points2[i] of points known to be on the curve. The slope denominators of all
+        pairs - x2 - x1 for distinct x values and 2y for doublings - are inverted together with a single modular
+        inversion, see batch_invert. Pairs involving the point at infinity or inverse points need no inversion
+        and are added individually.
+        '''
+        p = self.p
+        a = self.a
+
+        # Collect distinct pairs and doublings
+        distinct = []
+        doubles = []
+        for i, (point1, point2) in enumerate(zip(points1, points2)):
+            if point1 is None or point2 is None:
+                continue
+            if (point1[0] - point2[0]) % p != 0:
+                distinct.append(i)
+            elif (point1[1] - point2[1]) % p == 0 and point1[1] % p != 0:
+                doubles.append(i)
+
+        # Invert all denominators at once
+        inverses = batch_invert([points2[i][0] - points1[i][0] for i in distinct] +
+                                [2 * points1[i][1] for i in doubles], p)
+
+        # Apply the addition formulas
+        sums = [None] * len(points1)
+        for i, inverse in zip(distinct, inverses):
+            x1, y1 = points1[i]
+            x2, y2 = points2[i]
+            m = ((y2 - y1) * inverse) % p
+            x3 = (m * m - x1 - x2) % p
+            y3 = (m * (x1 - x3) - y1) % p
+            sums[i] = (int(x3), int(y3))
+
+        # Apply the doubling formulas
+        for i, inverse in zip(doubles, inverses[len(distinct):]):
+            x1, y1 = points1[i]
+            m = ((3 * x1 * x1 + a) * inverse) % p
+            x3 = (m * m - 2 * x1) % p
+            y3 = (m * (x1 - x3) - y1) % p
+            sums[i] = (int(x3), int(y3))
+
+        # Remaining pairs
+        for i in set(range(len(points1))).difference(distinct, doubles):
+            sums[i] = self._add_points_unchecked(points1[i], points2[i])
+
+        return sums
+
+    # --- Jacobian coordinates --- #
+
+    def _to_jacobian(self, point: tuple) -> tuple:
+        '''
+        Lifts the affine point (x,y) to the Jacobian triple (x,y,1). The point at infinity is given by Z = 0.
+        '''
+        if point is None:
+            return JACOBIAN_INFINITY
+        x, y = point
+        return (mpz(x), mpz(y), mpz(1))
+
+    def _to_affine(self, jac_point: tuple):
+        '''
+        Projects the Jacobian triple (X,Y,Z) back to the affine point (X/Z^2, Y/Z^3). This is the only step in
+        Jacobian arithmetic which requires a modular inversion.
+        '''
+        X, Y, Z = jac_point
+        if Z % self.p == 0:
             return None
+        zinv = invert(Z, self.p)
+        zinv2 = (zinv * zinv) % self.p
+        return (int((X * zinv2) % self.p), int((Y * zinv2 * zinv) % self.p))
 
-        # Return sum of points
-        return point
+    def _batch_to_affine(self, jac_points: list) -> list:
+        '''
+        Projects a list of Jacobian triples back to affine points, as in _to_affine. The Z values are inverted
+        together with a single modular inversion, see batch_invert.
+        '''
+        p = self.p
+
+        # Invert the Z values of the points not at infinity
+        finite = [i for i, (X, Y, Z) in enumerate(jac_points) if Z % p != 0]
+        inverses = batch_invert([jac_points[i][2] for i in finite], p)
+
+        points = [None] * len(jac_points)
+        for i, zinv in zip(finite, inverses):
+            X, Y, Z = jac_points[i]
+            zinv2 = (zinv * zinv) % p
+            points[i] = (int((X * zinv2) % p), int((Y * zinv2 * zinv) % p))
+        return points
+
+    def _jac_double(self, jac_point: tuple) -> tuple:
+        '''
+        Doubles a point in Jacobian coordinates using only multiplications mod p:
+
+            S = 4XY^2, M = 3X^2 + aZ^4, X' = M^2 - 2S, Y' = M(S - X') - 8Y^4, Z' = 2YZ
+        '''
+        X, Y, Z = jac_point
+        p = self.p
+
+        # Point at infinity or point on the x-axis
+        if Z == 0 or Y == 0:
+            return JACOBIAN_INFINITY
+
+        YY = (Y * Y) % p
+        ZZ = (Z * Z) % p
+        S = (4 * X * YY) % p
+        M = (3 * X * X + self.a * ZZ * ZZ) % p
+        X3 = (M * M - 2 * S) % p
+        Y3 = (M * (S - X3) - 8 * YY * YY) % p
+        Z3 = (2 * Y * Z) % p
+        return (X3, Y3, Z3)
+
+    def _jac_double_a0(self, jac_point: tuple) -> tuple:
+        '''
+        Doubles a point in Jacobian coordinates on a curve with a = 0, using the dbl-2009-l formulas:
+
+            A = X^2, B = Y^2, C = B^2, D = 2((X + B)^2 - A - C), E = 3A, F = E^2
+            X' = F - 2D, Y' = E(D - X') - 8C, Z' = 2YZ
 
-    def scalar_multiplication(self, n: int, point: tuple):
+        This needs 7 multiplications mod p, compared to 10 in _jac_double.
         '''
-        We use the double-and-add algorithm to add a point P with itself n times.
+        X, Y, Z = jac_point
+        p = self.p
+
+        # Point at infinity or point on the x-axis
+        if Z == 0 or Y == 0:
+            return JACOBIAN_INFINITY
+
+        # E = 3A and F = E^2 are left unreduced, as they only appear in reduced expressions
+        A = (X * X) % p
+        B = (Y * Y) % p
+        C = (B * B) % p
+        XB = X + B
+        D = 2 * ((XB * XB - A - C) % p)
+        E = 3 * A
+        X3 = (E * E - 2 * D) % p
+        Y3 = (E * (D - X3) - 8 * C) % p
+        Z3 = (2 * Y * Z) % p
+        return (X3, Y3, Z3)
+
+    def _jac_add(self, jac_point1: tuple, jac_point2: tuple, mixed=True) -> tuple:
+        '''
+        Adds two points in Jacobian coordinates using only multiplications mod p:
+
+            U1 = X1Z2^2, U2 = X2Z1^2, S1 = Y1Z2^3, S2 = Y2Z1^3, H = U2 - U1, R = S2 - S1
+            X3 = R^2 - H^3 - 2U1H^2, Y3 = R(U1H^2 - X3) - S1H^3, Z3 = HZ1Z2
+
+        If the points are equal we dispatch to the doubling. If Z2 = 1, as for precomputed tables stored in affine
+        form, we skip the computation of U1 and S1 (mixed addition). Setting mixed to False always uses the general
+        formulas, so that the operations don't depend on the value of Z2.
+        '''
+        X1, Y1, Z1 = jac_point1
+        X2, Y2, Z2 = jac_point2
+        p = self.p
+
+        # Point at infinity cases
+        if Z1 == 0:
+            return jac_point2
+        if Z2 == 0:
+            return jac_point1
+
+        # U1, U2 and S2 are only used in reduced differences or products, so we leave them unreduced
+        Z1Z1 = (Z1 * Z1) % p
+        U2 = X2 * Z1Z1
+        S2 = Y2 * Z1 * Z1Z1
+        if mixed and Z2 == 1:
+            U1 = X1
+            S1 = Y1
+        else:
+            Z2Z2 = (Z2 * Z2) % p
+            U1 = X1 * Z2Z2
+            S1 = (Y1 * Z2 * Z2Z2) % p
+        H = (U2 - U1) % p
+        R = (S2 - S1) % p
+
+        # Same x value - either the points are equal or inverses
+        if H == 0:
+            if R == 0:
+                return self._dbl(jac_point1)
+            return JACOBIAN_INFINITY
+
+        HH = (H * H) % p
+        HHH = (H * HH) % p
+        V = (U1 * HH) % p
+        X3 = (R * R - HHH - 2 * V) % p
+        Y3 = (R * (V - X3) - S1 * HHH) % p
+        Z3 = (H * Z1 * Z2) % p
+        return (X3, Y3, Z3)
+
+    def scalar_multiplication(self, n: int, point: tuple, constant_time=False):
+        '''
+        We use the windowed non-adjacent form (wNAF) of n to add a point P with itself n times.
 
         Algorithm:
         ---------
-        Break n into a binary representation (big-endian).
-        Then iterate over each bit in the representation as follows:
-            1) If it's the first bit, ignore;
-            2) double the previous result (starting with P)
-            3) if the bit = 1, add a copy of P to the result.
-
-        Ex: n = 26. Binary representation = 11010
-            bit     | action        | result
+        Write n in width-w NAF: a sequence of signed digits, each either 0 or odd with |d| < 2^(w-1), such that
+        any w consecutive digits contain at most one non-zero digit. Precompute the odd multiples
+        P, 3P, 5P, ..., (2^(w-1) - 1)P. Then iterate over the digits from most significant to least as follows:
+            1) double the previous result (starting with the point at infinity);
+            2) if the digit d > 0, add dP to the result;
+            3) if the digit d < 0, add -|d|P to the result.
+
+        Ex: n = 26, w = 3. wNAF (big-endian) = 1 0 0 0 -3 0
+            digit   | action        | result
             --------------------------------
-            1       | ignore        | P
-            1       | double/add    | 2P + P = 3P
-            0       | double        | 6P
-            1       | double/add    | 12P + P = 13P
+            1       | double/add    | 0 + P = P
+            0       | double        | 2P
+            0       | double        | 4P
+            0       | double        | 8P
+            -3      | double/add    | 16P - 3P = 13P
             0       | double        | 26P
+
+        The doubling and addition steps are performed in Jacobian coordinates, so that the only modular inversion
+        happens when the result is returned to affine coordinates.
+
+        If constant_time is True, we use the Montgomery ladder instead, see _ladder_multiply.
+
+        The point at infinity is given by None, and we raise a ValueError if the point is not on the curve.
         '''
         # Retrieve order if it's None - only for small primes
         if self.order is None:
-            self.order = self.get_order()
+            self.order = mpz(self.get_order())
 
         # Point at infinity case
         if point is None:
             return None
 
+        # Verify point exists - the group operations keep every intermediate result on the curve
+        if not self.is_point_on_curve(point):
+            raise ValueError('Point is not on the curve')
+
         # Scalar multiple divides group order
         if n % self.order == 0:
             return None
@@ -250,50 +542,350 @@ class EllipticCurve:
         # Take residue of n modulo the group order
         n = n % self.order
 
-        # Proceed with algorithm
-        bitstring = bin(n)[2:]
-        temp_point = point
-        for x in range(1, len(bitstring)):
-            temp_point = self.add_points(temp_point, temp_point)  # Double regardless of bit
-            bit = int(bitstring[x:x + 1], 2)
-            if bit == 1:
-                temp_point = self.add_points(temp_point, point)  # Add to the doubling if bit == 1
+        # Proceed with algorithm and return to affine coordinates
+        multiply = self._ladder_multiply if constant_time else self._jac_multiply
+        point = self._to_affine(multiply(n, self._to_jacobian(point)))
 
-        # Verify results
-        try:
-            assert self.is_point_on_curve(temp_point)
-        except AssertionError:
+        # Verify results in debug mode
+        if ECC_DEBUG:
+            assert self.is_point_on_curve(point)
+
+        # Return point
+        return point
+
+    def _jac_multiply(self, n: int, jac_point: tuple) -> tuple:
+        '''
+        Returns n * jac_point in Jacobian coordinates using the wNAF algorithm described in scalar_multiplication.
+        The scalar n is not reduced modulo the group order.
+        '''
+        # Bind group operations as locals for the loops
+        p = self.p
+        add = self._jac_add
+        double = self._dbl
+
+        # Small scalars (e.g. on curves of tiny order) fall back to plain NAF, which needs no precomputation
+        w = self.WNAF_WIDTH if n.bit_length() >= self.WNAF_MIN_BITS else 2
+
+        # Precompute odd multiples P, 3P, 5P, ..., (2^(w-1) - 1)P in Jacobian coordinates
+        precomputed = [jac_point]
+        if w > 2:
+            double_point = double(jac_point)
+            for _ in range(1, 1 << (w - 2)):
+                precomputed.append(add(precomputed[-1], double_point))
+
+        # Proceed with algorithm in Jacobian coordinates
+        temp_point = JACOBIAN_INFINITY
+        for digit in reversed(wnaf(n, w)):
+            temp_point = double(temp_point)
+            if digit > 0:
+                temp_point = add(temp_point, precomputed[digit // 2])
+            elif digit < 0:
+                X, Y, Z = precomputed[-digit // 2]
+                temp_point = add(temp_point, (X, p - Y, Z))
+
+        return temp_point
+
+    def generator_multiplication(self, n: int, constant_time=False):
+        '''
+        Returns n * generator using a fixed-base window table. As the generator is fixed for the lifetime of the
+        curve, we precompute a table of its multiples once and reuse it for every call, see _scalar_mul_fixed.
+
+        If constant_time is True, we use the Montgomery ladder instead, see _ladder_multiply. The table lookups
+        depend on the windows of n, so they aren't suitable for secret scalars on shared hardware.
+        '''
+        # Retrieve order if it's None - only for small primes
+        if self.order is None:
+            self.order = mpz(self.get_order())
+
+        # Scalar multiple divides group order
+        if n % self.order == 0:
             return None
 
+        # Take residue of n modulo the group order
+        n = n % self.order
+
+        # Proceed with algorithm and return to affine coordinates
+        if constant_time:
+            point = self._to_affine(self._ladder_multiply(n, self._to_jacobian(self.generator)))
+        else:
+            point = self._to_affine(self._scalar_mul_fixed(n))
+
+        # Verify results in debug mode
+        if ECC_DEBUG:
+            assert self.is_point_on_curve(point)
+
         # Return point
+        return point
+
+    def _scalar_mul_fixed(self, n: int) -> tuple:
+        '''
+        Returns n * generator in Jacobian coordinates, for 0 <= n < order.
+
+        Algorithm:
+        ---------
+        Let w denote the window width and write n in signed base 2^w, so that n = sum_i n_i * 2^(w*i) with
+        -2^(w-1) < n_i <= 2^(w-1). The table stores
+
+            T[i][j] = j * 2^(w*i) * generator,   for j in [0, 2^(w-1)],
+
+        so that n * generator = sum_i sign(n_i) * T[i][|n_i|], using that the negative of (X,Y,Z) is (X,-Y,Z). This
+        costs one addition per window and no doublings, compared to L doublings in scalar_multiplication, where L
+        is the bit length of the group order. The signed digits halve the size of the table.
+        '''
+        # Build the table on first use
+        if self._gen_table is None:
+            self._gen_table = self._build_generator_table()
+        w, table = self._gen_table
+        size = 1 << w
+        half = size >> 1
+        mask = size - 1
+
+        # Bind group operation as local for the loop
+        p = self.p
+        add = self._jac_add
+
+        # Sum the table entries given by the signed windows of n
+        temp_point = JACOBIAN_INFINITY
+        for row in table:
+            digit = n & mask
+            n >>= w
+            if digit > half:
+                digit -= size
+                n += 1
+            if digit > 0:
+                temp_point = add(temp_point, row[digit])
+            elif digit < 0:
+                X, Y, Z = row[-digit]
+                temp_point = add(temp_point, (X, p - Y, Z))
+
         return temp_point
 
+    def _build_generator_table(self) -> tuple:
+        '''
+        Returns the window width w and the table T used in _scalar_mul_fixed. The table entries are affine points
+        lifted to Jacobian coordinates with Z = 1, so that _scalar_mul_fixed uses mixed additions.
+        '''
+        # Curves of tiny order don't need the full window
+        bits = self.order.bit_length()
+        w = min(self.FIXED_WINDOW, bits)
+
+        # Get the bases 2^(w*i) * generator - the signed windows of n may carry into an extra window
+        bases = [self._to_jacobian(self.generator)]
+        for _ in range(1, -(-(bits + 1) // w)):
+            base = bases[-1]
+            for _ in range(w):
+                base = self._dbl(base)
+            bases.append(base)
+        bases = self._batch_to_affine(bases)
+
+        # Extend every row by its base one entry at a time - the additions across rows are done as one batch
+        rows = [[None, base] for base in bases]
+        for _ in range(2, (1 << (w - 1)) + 1):
+            for row, point in zip(rows, self._batch_add_points([row[-1] for row in rows], bases)):
+                row.append(point)
+
+        return w, [[self._to_jacobian(point) for point in row] for row in rows]
+
+    def _ladder_multiply(self, n: int, jac_point: tuple) -> tuple:
+        '''
+        Returns n * jac_point in Jacobian coordinates using the Montgomery ladder, which performs one addition and
+        one doubling for every bit of n regardless of its value.
+
+        Algorithm:
+        ---------
+        Let L denote the bit length of the group order. We first replace n with n + order or n + 2 * order, so
+        that n has exactly L + 1 bits and the number of iterations doesn't depend on n. Starting with R0 = P and
+        R1 = 2P, iterate over the remaining bits of n from most significant to least as follows:
+            1) if the bit = 0, set R1 = R0 + R1 and R0 = 2 * R0;
+            2) if the bit = 1, set R0 = R0 + R1 and R1 = 2 * R1.
+        The invariant R1 - R0 = P holds throughout. Instead of branching on the bit, we conditionally swap R0 and
+        R1 before and after the step using bit masks. The additions don't use the mixed formulas: P enters with
+        Z = 1, so whether the first addition could take the mixed shortcut depends on the first swap.
+
+        NOTE: Python integers aren't constant time, so this only removes the scalar dependent control flow.
+        '''
+        # Retrieve order if it's None - only for small primes
+        if self.order is None:
+            self.order = mpz(self.get_order())
+        order = self.order
+
+        # Fix the bit length of n
+        n = n % order + order
+        if n.bit_length() == order.bit_length():
+            n += order
+
+        # Bind group operations as locals for the loop
+        add = self._jac_add
+        double = self._dbl
+        cswap = self._cswap
+
+        R0 = jac_point
+        R1 = double(jac_point)
+        for i in range(order.bit_length() - 1, -1, -1):
+            mask = -((n >> i) & 1)
+            R0, R1 = cswap(mask, R0, R1)
+            R1 = add(R0, R1, False)
+            R0 = double(R0)
+            R0, R1 = cswap(mask, R0, R1)
+        return R0
+
+    def _cswap(self, mask: int, jac_point1: tuple, jac_point2: tuple) -> tuple:
+        '''
+        Returns the two points swapped if mask = -1 and unchanged if mask = 0, using bitwise operations only.
+        '''
+        X1, Y1, Z1 = jac_point1
+        X2, Y2, Z2 = jac_point2
+        dX = mask & (X1 ^ X2)
+        dY = mask & (Y1 ^ Y2)
+        dZ = mask & (Z1 ^ Z2)
+        return (X1 ^ dX, Y1 ^ dY, Z1 ^ dZ), (X2 ^ dX, Y2 ^ dY, Z2 ^ dZ)
+
     def get_order(self):
         '''
-        We naively calculate the order by iterating over all x in F_p. If x is on the curve we
-        obtain y. If y is not zero, then we known (x,y) and (x,p-y) are two points on the curve. Otherwise, (x,
-        0) is a point on the curve (on the x-axis). Hence, we sum up these values and add the point at infinity to
-        return the order.
+        We calculate the order using the baby-step giant-step algorithm on random points.
+
+        Algorithm:
+        ---------
+        By the Hasse bound, the order N satisfies |p + 1 - N| <= B, where B = floor(2 * sqrt(p)).
+        For a random point P, let Q = (p+1)P and let m = ceil(sqrt(B)).
+
+        1) Baby steps: store the x values of jP for j in [1, m]. If the order of P is at most 2m + 1,
+           choose another point.
+        2) Giant steps: for each c = -B + m, -B + 3m + 1, ... compute R = Q - cP and look for R = sP with
+           |s| <= m, using the x value of R and the sign of y. Every such match gives t = c + s with tP = Q,
+           hence a candidate order N = p + 1 - t with NP = 0.
+        3) The order is one of the candidates. Intersect the candidates over random points until only one
+           remains, which amounts to taking the lcm of the orders of the points.
+
+        This needs O(p^(1/4)) group operations per point. If the candidates aren't narrowed down to one after
+        BSGS_ATTEMPTS points, or p < BSGS_MIN_PRIME, we count the points directly.
+        '''
+        p = self.p
+
+        # Count points for tiny primes
+        if p < self.BSGS_MIN_PRIME:
+            return self._count_points()
+
+        # Get Hasse bound and number of baby steps
+        B = math.isqrt(4 * p)
+        m = math.isqrt(B) + 1
+        step = 2 * m + 1
+
+        # Bind group operations as locals for the loops
+        add_distinct = self._add_distinct
+        add = self._add_points_unchecked
+
+        candidates = None
+        for _ in range(self.BSGS_ATTEMPTS):
+            point = self.random_point()
+
+            # 1) Baby steps jP for j in [1, m] - once stored, jP != +/- P, so we can use the distinct addition
+            baby_steps = {point[0]: (1, point[1])}
+            temp_point = self._double_point(point)
+            for j in range(2, m + 1):
+                if temp_point is None or temp_point[0] in baby_steps:
+                    break
+                baby_steps[temp_point[0]] = (j, temp_point[1])
+                temp_point = add_distinct(temp_point, point)
+
+            # Order of P is at most 2m + 1 if some jP = 0 or (m+1)P = +/- jP
+            if len(baby_steps) < m or temp_point is None or temp_point[0] in baby_steps:
+                continue
+
+            # 2) Giant steps R = Q - cP for c = -B + m, -B + 3m + 1, ...
+            c = m - B
+            R, neg_giant_step = self._batch_to_affine([
+                self._jac_multiply(p + 1 - c, self._to_jacobian(point)),
+                self._jac_multiply(step, self._to_jacobian((point[0], p - point[1])))
+            ])
+            point_candidates = set()
+            while c - m <= B:
+                if R is None:
+                    point_candidates.add(p + 1 - c)
+                elif R[0] in baby_steps:
+                    j, y = baby_steps[R[0]]
+                    s = j if R[1] == y else -j
+                    point_candidates.add(p + 1 - c - s)
+                R = add(R, neg_giant_step)
+                c += step
+
+            # 3) Intersect candidates
+            if candidates is None:
+                candidates = point_candidates
+            else:
+                candidates &= point_candidates
+            if len(candidates) == 1:
+                return int(candidates.pop())
+
+        # Fall back to counting points
+        return self._count_points()
+
+    def _count_points(self):
+        '''
+        We naively calculate the order by iterating over all x in F_p. If r = x^3 + ax + b is a non-zero quadratic
+        residue, then there are two points (x,y) and (x,p-y) on the curve. If r = 0, then (x, 0) is a point on the
+        curve (on the x-axis). Hence, we sum up these values and add the point at infinity to return the order.
+
+        We never need y, so we look up the number of square roots of r in a table, built by squaring
+        1, ..., (p-1)/2. As r is a cubic in x, we step r along x with its finite differences
+
+            r(x+1) - r(x) = 3x^2 + 3x + 1 + a,    6x + 6,    6,
+
+        so that each x only needs additions and no multiplications or divisions mod p.
 
         NOTE: This should only be used for small primes.
         '''
+        a = int(self.a)
+        b = int(self.b)
+        p = int(self.p)
+
+        # Table of the number of square roots of each residue
+        roots = bytearray(p)
+        roots[0] = 1
+        for y in range(1, (p + 1) // 2):
+            roots[y * y % p] = 2
+
+        # Initial value and finite differences of r at x = 0
+        r = b % p
+        d1 = (1 + a) % p
+        d2 = 6 % p
+        d3 = 6 % p
 
         sum = 1  # Start with point of infinity
-        for x in range(0, self.p):
-            if self.is_x_on_curve(x):
-                y = self.find_y_from_x(x)
-                if y == 0:
-                    sum += 1
-                else:
-                    sum += 2
+        for _ in range(p):
+            sum += roots[r]
+            r += d1
+            if r >= p:
+                r -= p
+            d1 += d2
+            if d1 >= p:
+                d1 -= p
+            d2 += d3
+            if d2 >= p:
+                d2 -= p
         return sum
 
     # --- ECDSA --- #
 
-    def generate_signature(self, private_key: int, hex_string: str):
+    def _order_is_prime(self) -> bool:
+        '''
+        Returns True if the group order is prime. The result is cached together with the order, as isprime runs
+        several modular exponentiations for large orders.
+        '''
+        if self.order is None:
+            return False
+        if self._order_primality is None or self._order_primality[0] != self.order:
+            self._order_primality = (self.order, bool(isprime(self.order)))
+        return self._order_primality[1]
+
+    def generate_signature(self, private_key: int, hex_string: str, constant_time=False):
         '''
         For a given private_key and hex_string, we generate a signature for this curve.
 
+        If constant_time is True, the multiples of the generator are computed with the Montgomery ladder and k is
+        inverted using Fermat's little theorem, so that the sequence of operations doesn't depend on the secret
+        values k and private_key. With gmpy2 installed, the exponentiation uses the constant time powmod_sec.
+
 
         Algorithm:
         ---------
@@ -302,7 +894,7 @@ class EllipticCurve:
         Let t denote the private_key.
 
         1) Verify that n is prime - the signature will not work if we do not have prime group order.
-        2) Let Z denote the integer value of the first n BITS of the hex_string.
+        2) Let Z denote the integer value of the first L BITS of the hex_string, where L is the bit length of n.
         3) Select a random integer k in [1, n-1]. As n is prime, k will be invertible.
         4) Calculate the curve point (x,y) =  k * generator
         5) Compute r = x (mod n) and s = k^(-1)(Z + r * t) (mod n). If either r or s = 0, repeat from step 3.
@@ -313,29 +905,31 @@ class EllipticCurve:
         n = self.order
 
         # Return None if order not given or order isn't prime
-        if n is None or not isprime(n):
+        if not self._order_is_prime():
             return None
 
-        # 2) Take the first n bits of the hex string
-        Z = int(bin(int(hex_string, 16))[2:2 + n], 2)
+        # 2) Take the first L bits of the hex string
+        Z = self._hash_to_integer(hex_string)
 
         # 3) Select a random integer k (Loop from here)
-        signed = False
-        sig = None
-        while not signed:
-            k = secrets.randbelow(n)
+        r = s = 0
+        while r == 0 or s == 0:
+            k = secrets.randbelow(n - 1) + 1
 
             # 4) Calculate curve point
-            x, y = self.scalar_multiplication(k, self.generator)
+            x, y = self.generator_multiplication(k, constant_time)
+            k_inv = powmod_sec(k, n - 2, n) if constant_time else invert(k, n)
 
             # 5) Compute r and s
             r = x % n
-            s = (pow(k, -1, n) * (Z + r * private_key)) % n
+            s = (k_inv * (Z + r * private_key)) % n
+
+        sig = (int(r), int(s))
 
-            if r != 0 and s != 0:
-                sig = (r, s)
-                public_key = self.scalar_multiplication(private_key, self.generator)
-                signed = self.verify_signature(signature=sig, hex_string=hex_string, public_key=public_key)
+        # Verify results in debug mode
+        if ECC_DEBUG:
+            public_key = self.generator_multiplication(private_key, constant_time)
+            assert self.verify_signature(signature=sig, hex_string=hex_string, public_key=public_key)
 
         # 6) Return the signature (r,s)
         return sig
@@ -349,36 +943,42 @@ class EllipticCurve:
         Let n denote the group order of the elliptic curve.
 
         1) Verify that n is prime and that (r,s) are integers in the interval [1,n-1]
-        2) Let Z be the integer value of the first n BITS of the transaction hash
+        2) Let Z be the integer value of the first L BITS of the transaction hash, where L is the bit length of n
         3) Let u1 = Z * s^(-1) (mod n) and u2 = r * s^(-1) (mod n)
         4) Calculate the curve point (x,y) = (u1 * generator) + (u2 * public_key)
             (where * is scalar multiplication, and + is elliptic curve point addition mod p)
+            The multiple of the generator uses the precomputed table, see _scalar_mul_fixed. It needs no
+            doublings, so sharing doublings with u2 * public_key via Shamir's trick would only add work.
         5) If r = x (mod n), the signature is valid.
         '''
 
         # Get signature values
         (r, s) = signature
 
+        # Verify public key
+        if public_key is None or not self.is_point_on_curve(public_key):
+            return False
+
         # 1) Verify our values first
         n = self.order  # From the factory, we know that the order will be given.
         try:
             assert 1 <= r <= n - 1
             assert 1 <= s <= n - 1
-            assert isprime(n)
+            assert self._order_is_prime()
         except AssertionError:
             return False
 
-        # 2) Take the first n bits of the transaction hash
-        Z = int(bin(int(hex_string, 16))[2:2 + n], 2)
+        # 2) Take the first L bits of the transaction hash
+        Z = self._hash_to_integer(hex_string)
 
         # 3) Calculate u1 and u2
-        s_inv = pow(s, -1, n)
+        s_inv = invert(s, n)
         u1 = (Z * s_inv) % n
         u2 = (r * s_inv) % n
 
         # 4) Calculate the point
-        point = self.add_points(self.scalar_multiplication(u1, self.generator),
-                                self.scalar_multiplication(u2, public_key))
+        point = self._to_affine(self._jac_add(self._jac_multiply(u2, self._to_jacobian(public_key)),
+                                              self._scalar_mul_fixed(u1)))
 
         # 5) Return True/False based on x. Account for point at infinity.
         if point is None:
@@ -386,6 +986,63 @@ class EllipticCurve:
         x, y = point
         return r == x % n
 
+    def verify_signatures(self, signatures: list) -> bool:
+        '''
+        We verify a batch of signatures, given as a list of (signature, hex_string, public_key) tuples, and return
+        True if every signature is valid.
+
+        The algorithm is the same as in verify_signature, with two savings:
+            - the inverses of all s values are computed with a single modular inversion, see batch_invert;
+            - instead of returning each point (X,Y,Z) to affine coordinates, we check that r = x (mod n) by
+              comparing X with (r + kn) * Z^2 (mod p) for every r + kn < p, which needs no inversion.
+
+        NOTE: A signature only determines the x value of the point k * generator, not its sign. Hence ECDSA
+        signatures can't be checked with a single random linear combination, as is done for Schnorr signatures.
+        '''
+        n = self.order
+        p = self.p
+
+        # Verify our values first
+        if not self._order_is_prime():
+            return False
+        for (r, s), hex_string, public_key in signatures:
+            if not (1 <= r <= n - 1 and 1 <= s <= n - 1):
+                return False
+            if public_key is None or not self.is_point_on_curve(public_key):
+                return False
+
+        # Invert all s values at once
+        s_inverses = batch_invert([s for (r, s), hex_string, public_key in signatures], n)
+
+        for ((r, s), hex_string, public_key), s_inv in zip(signatures, s_inverses):
+            # Calculate u1 and u2
+            Z = self._hash_to_integer(hex_string)
+            u1 = (Z * s_inv) % n
+            u2 = (r * s_inv) % n
+
+            # Calculate the point in Jacobian coordinates
+            jac_point = self._jac_multiply(u2, self._to_jacobian(public_key))
+            X, Y, Z1 = self._jac_add(jac_point, self._scalar_mul_fixed(u1))
+            if Z1 % p == 0:
+                return False
+
+            # Look for x = r (mod n) with X = x * Z1^2 (mod p)
+            Z1Z1 = (Z1 * Z1) % p
+            x = r
+            while x < p and (X - x * Z1Z1) % p != 0:
+                x += n
+            if x >= p:
+                return False
+
+        return True
+
+    def _hash_to_integer(self, hex_string: str) -> int:
+        '''
+        Returns the integer value of the first L bits of the hex_string, where L is the bit length of the group
+        order. Leading zeros count towards the length of the hex_string, so that every hex digit is 4 bits.
+        '''
+        digits = hex_string[2:] if hex_string[:2].lower() == '0x' else hex_string
+        return int(digits, 16) >> max(0, 4 * len(digits) - self.order.bit_length())
 
     # --- Point compression/decompression --- #
     def compress_point(self, point: tuple):
@@ -422,20 +1079,20 @@ class EllipticCurve:
             parity = int(hex_string[:2],16)
             x = int(hex_string[2:],16)
 
-        #Find candidate y from x
+        #Find candidate y from x - find_y_from_x returns None if x is not on the curve
         temp_y = self.find_y_from_x(x)
+        if temp_y is None:
+            return None
 
         #Choose correct y based on parity
         if temp_y % 2 == parity % 2:
             y = temp_y
         else:
-            y = self.p - temp_y
+            y = int(self.p - temp_y)
 
-        #Verify point
-        try:
+        #Verify results in debug mode
+        if ECC_DEBUG:
             assert self.is_point_on_curve((x,y))
-        except AssertionError:
-            return None
 
         return (x,y)
         
@@ -1,8 +1,11 @@
 # ---IMPORTS---#
 import random
+import secrets
 
+import pytest
 from primefac import isprime
 
+from src.basicblockchains_ecc import cryptomath as CM
 from src.basicblockchains_ecc import elliptic_curve as EC
 
 # ---CONSTANTS---#
@@ -116,6 +119,22 @@ def test_secp_curves():
         assert curve.p - i2 == p2
 
 
+def test_invalid_points():
+    '''
+    We verify that the group operations raise a ValueError for points not on the curve, while None is the point at
+    infinity.
+    '''
+    curve = EC.secp256k1()
+    gx, gy = curve.generator
+    with pytest.raises(ValueError):
+        curve.add_points(curve.generator, (gx, gy + 1))
+    with pytest.raises(ValueError):
+        curve.scalar_multiplication(2, (gx, gy + 1))
+    assert curve.add_points(None, curve.generator) == curve.generator
+    assert curve.add_points(curve.generator, (gx, curve.p - gy)) is None
+    assert curve.scalar_multiplication(2, None) is None
+
+
 def test_point_compression():
     for curve in curve_list:
         random_point = curve.random_point()
@@ -123,6 +142,175 @@ def test_point_compression():
         decompressed_point = curve.decompress_point(compressed_point)
         assert decompressed_point == random_point
 
+        # x values not on the curve can't be decompressed
+        x = random.randrange(curve.p)
+        while curve.is_x_on_curve(x):
+            x = random.randrange(curve.p)
+        assert curve.decompress_point('0x02' + hex(x)[2:]) is None
+
+
+def test_generator_multiplication():
+    '''
+    We verify that the generator table agrees with scalar multiplication and the Montgomery ladder, and that
+    signatures verify.
+    '''
+    for curve in curve_list:
+        n = random.randrange(1, curve.order)
+        assert curve.generator_multiplication(n) == curve.scalar_multiplication(n, curve.generator)
+        assert curve.generator_multiplication(n, constant_time=True) == curve.generator_multiplication(n)
+        assert curve.generator_multiplication(curve.order) is None
+
+        private_key = random.randrange(1, curve.order)
+        public_key = curve.generator_multiplication(private_key)
+        hex_string = secrets.token_hex(32)
+        signature = curve.generate_signature(private_key, hex_string)
+        assert curve.verify_signature(signature, hex_string, public_key)
+
+        # Signatures use the first L bits of the hex string, where L is the bit length of the order
+        Z = int(hex_string, 16) >> max(0, 256 - curve.order.bit_length())
+        assert curve._hash_to_integer(hex_string) == curve._hash_to_integer('0x' + hex_string) == Z
+
+        # Constant time signatures use the Montgomery ladder
+        signature = curve.generate_signature(private_key, hex_string, constant_time=True)
+        assert curve.verify_signature(signature, hex_string, public_key)
+
+
+def test_ladder_control_flow():
+    '''
+    We verify that the Montgomery ladder takes the same path through the additions for every scalar, in particular
+    that it never takes the mixed addition shortcut.
+    '''
+    curve = EC.secp256k1()
+    jac_generator = curve._to_jacobian(curve.generator)
+    add = curve._jac_add
+
+    traces = []
+    for n in [1, 2, curve.order // 2, curve.order - 1]:
+        point = curve.scalar_multiplication(n, curve.generator)
+        trace = []
+
+        def traced_add(jac_point1, jac_point2, mixed=True):
+            trace.append(mixed and jac_point2[2] == 1)
+            return add(jac_point1, jac_point2, mixed)
+
+        curve._jac_add = traced_add
+        assert curve._to_affine(curve._ladder_multiply(n, jac_generator)) == point
+        del curve._jac_add
+        traces.append(trace)
+
+    assert not any(traces[0])
+    assert all(trace == traces[0] for trace in traces)
+
+
+def test_verify_signatures():
+    '''
+    We verify that a batch of valid signatures verifies, and that it fails if any signature is changed.
+    '''
+    for curve in [curve_list[0], curve_list[4], curve_list[7]]:
+        batch = []
+        for _ in range(5):
+            private_key = random.randrange(1, curve.order)
+            hex_string = secrets.token_hex(32)
+            signature = curve.generate_signature(private_key, hex_string)
+            batch.append((signature, hex_string, curve.generator_multiplication(private_key)))
+        assert curve.verify_signatures(batch)
+
+        (r, s), hex_string, public_key = batch[2]
+        batch[2] = ((r, s % (curve.order - 1) + 1), hex_string, public_key)
+        assert not curve.verify_signatures(batch)
+
+
+def test_get_order():
+    '''
+    We verify that the baby-step giant-step order agrees with naively counting the points on random curves.
+    '''
+    prime_list = create_odd_prime_list()
+    for _ in range(20):
+        p = random.choice(prime_list)
+        a = random.randrange(p)
+        b = random.randrange(p)
+        if (4 * pow(a, 3) + 27 * pow(b, 2)) % p == 0:
+            continue
+        curve = EC.EllipticCurve(a, b, p)
+        assert curve.order == count_points(curve)
+
+    # y^2 = x^3 + 2x + 2 over F_3 only has the point at infinity
+    curve = EC.EllipticCurve(2, 2, 3)
+    assert curve.order == 1
+    assert curve.generator is None
+
+
+def test_jacobi_symbol():
+    '''
+    We verify that the Jacobi symbol agrees with the Legendre symbol for odd primes.
+    '''
+    for p in create_odd_prime_list()[:50] + [P]:
+        for _ in range(20):
+            n = random.randrange(p)
+            assert CM.jacobi_symbol(n, p) == CM.legendre_symbol(n, p)
+
+
+def test_tonelli_shanks():
+    '''
+    We verify that tonelli_shanks returns a square root of each quadratic residue, covering primes congruent to
+    3 mod 4, 5 mod 8 and 1 mod 8.
+    '''
+    for p in create_odd_prime_list()[:50] + [P]:
+        for _ in range(20):
+            n = pow(random.randrange(p), 2, p)
+            r = CM.tonelli_shanks(n, p)
+            assert (r * r) % p == n
+
+
+def test_batch_invert():
+    '''
+    We verify that batch inversion agrees with inverting each value.
+    '''
+    values = [random.randrange(1, P) for _ in range(20)]
+    assert CM.batch_invert(values, P) == [pow(v, -1, P) for v in values]
+    assert CM.batch_invert([], P) == []
+
+
+def test_batch_to_affine():
+    '''
+    We verify that projecting a batch of Jacobian points agrees with projecting each point, including the point at
+    infinity.
+    '''
+    for curve in curve_list:
+        jac_point = curve._to_jacobian(curve.random_point())
+        jac_points = [curve._jac_multiply(random.randrange(1, curve.order), jac_point) for _ in range(5)]
+        jac_points.append(EC.JACOBIAN_INFINITY)
+        assert curve._batch_to_affine(jac_points) == [curve._to_affine(jac_point) for jac_point in jac_points]
+
+
+def test_batch_add_points():
+    '''
+    We verify that adding a batch of points agrees with adding each pair, including doublings, inverse points and
+    the point at infinity.
+    '''
+    for curve in curve_list:
+        points = [curve.random_point() for _ in range(5)]
+        x, y = points[1]
+        others = [curve.random_point(), (x, curve.p - y), None, points[3], points[4]]
+        points[3] = None
+        sums = [curve.add_points(point1, point2) for point1, point2 in zip(points, others)]
+        assert curve._batch_add_points(points, others) == sums
+
+
+def test_wnaf():
+    '''
+    We verify that the wNAF digits of a random scalar recover the scalar and satisfy the non-adjacency property.
+    '''
+    for w in range(2, 7):
+        n = random.randrange(1, ORDER)
+        digits = CM.wnaf(n, w)
+        assert sum(d << i for i, d in enumerate(digits)) == n
+        for i, d in enumerate(digits):
+            if d != 0:
+                assert d % 2 == 1
+                assert abs(d) < pow(2, w - 1)
+                assert all(x == 0 for x in digits[i + 1:i + w])
+
 
 # --- HELPER FUNCTIONS --- #
 
@@ -137,3 +325,14 @@ def create_odd_prime_list() -> list:
             prime_list.append(x)
         x += 1
     return prime_list
+
+
+def count_points(curve) -> int:
+    '''
+    We return the number of points on the curve, including the point at infinity, by checking every x.
+    '''
+    count = 1
+    for x in range(curve.p):
+        if curve.is_x_on_curve(x):
+            count += 1 if curve.x_terms(x) % curve.p == 0 else 2
+    return count